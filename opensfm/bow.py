@@ -10,15 +10,22 @@ class BagOfWords:
     def __init__(self, words, frequencies):
         self.words = words
         self.frequencies = frequencies
-        self.weights = np.log(frequencies.sum() / frequencies)
+        self.weights = np.ascontiguousarray(
+            np.log(frequencies.sum() / frequencies), dtype=np.float32
+        )
         FLANN_INDEX_KDTREE = 1
         flann_params = {"algorithm": FLANN_INDEX_KDTREE, "trees": 8, "checks": 300}
         self.index = context.flann_Index(words, flann_params)
+        # Lazily computed by the EXACT matcher
+        self._words_f32 = None
+        self._words_half_norms = None
 
     def map_to_words(self, descriptors, k, matcher_type="FLANN"):
         if matcher_type == "FLANN":
             params = {"checks": 200}
             idx, dist = self.index.knnSearch(descriptors, k, params=params)
+        elif matcher_type == "EXACT":
+            idx = self._exact_knn(descriptors, k)
         else:
             matcher = cv2.DescriptorMatcher_create(matcher_type)
             matches = matcher.knnMatch(descriptors, self.words, k=k)
@@ -26,9 +33,42 @@ class BagOfWords:
             idx = np.array(idx).astype(np.int32)
         return idx
 
+    def _exact_knn(self, descriptors, k, block_size=1024):
+        """Exact k nearest words using blocked matrix products.
+
+        Since |q - w|^2 = |q|^2 - 2 (q.w - |w|^2 / 2), ranking words by
+        |w|^2 / 2 - q.w gives the nearest ones with a single GEMM per block
+        of queries, and bounds the score matrix to block_size x len(words).
+        """
+        if self._words_half_norms is None:
+            words = np.ascontiguousarray(self.words, dtype=np.float32)
+            self._words_f32 = words
+            self._words_half_norms = 0.5 * np.einsum("ij,ij->i", words, words)
+        words = self._words_f32
+        half_norms = self._words_half_norms
+
+        descriptors = np.asarray(descriptors, dtype=np.float32)
+        k = min(k, len(words))
+        idx = np.empty((len(descriptors), k), dtype=np.int32)
+        for start in range(0, len(descriptors), block_size):
+            block = descriptors[start : start + block_size]
+            scores = half_norms - block @ words.T
+            if k < len(words):
+                nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(k), scores.shape)
+            order = np.argsort(np.take_along_axis(scores, nearest, axis=1), axis=1)
+            idx[start : start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        return idx
+
     def histogram(self, words):
-        h = np.bincount(words, minlength=len(self.words)) * self.weights
-        return h / h.sum()
+        # Accumulate the word weights directly instead of weighting the counts.
+        # The histogram allocated by bincount is the one returned: callers keep
+        # it (see pairs_selection.load_histograms), so it can't live in a shared
+        # scratch buffer, and np.add.at into a preallocated one is much slower.
+        h = np.bincount(words, weights=self.weights[words], minlength=len(self.words))
+        h /= h.sum()
+        return h
 
     def bow_distance(self, w1, w2, h1=None, h2=None):
         if h1 is None:
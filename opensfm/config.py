@@ -34,6 +34,8 @@ class OpenSfMConfig:
     feature_use_adaptive_suppression: bool = False
     # Bake segmentation info (class and instance) in the feature data. Thus it is done once for all at extraction time.
     features_bake_segmentation: bool = False
+    # Compress features files. Uncompressed files are larger but much faster to save and load.
+    features_compression: bool = True
 
     ##################################
     # Params for SIFT
@@ -116,7 +118,7 @@ class OpenSfMConfig:
     bow_words_to_match: int = 50
     # Number of matching features to check.
     bow_num_checks: int = 20
-    # Matcher type to assign words to features
+    # Matcher type to assign words to features (FLANN, EXACT or an OpenCV matcher type)
     bow_matcher_type: str = "FLANN"
 
     ##################################
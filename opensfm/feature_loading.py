@@ -179,13 +179,9 @@ class FeatureLoader:
         )
         if not features_data:
             return None
-        descriptors = features_data.descriptors
-        if descriptors is None:
+        if features_data.descriptors is None:
             return None
-        return features_data, ft.build_flann_index(
-            descriptors,
-            data.config,
-        )
+        return features_data, features_data.flann_index(data.config)
 
     @lru_cache(200)
     def load_words(self, data: DataSetBase, image: str, masked: bool) -> np.ndarray:
@@ -3,7 +3,7 @@
 
 import logging
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -12,6 +12,10 @@ from opensfm import context, pyfeatures
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# cv2.remap requires source and destination sizes below SHRT_MAX
+_REMAP_MAX_SIZE = 32767
+_REMAP_BLOCK = 1024
+
 
 class SemanticData:
     segmentation: np.ndarray
@@ -66,6 +70,19 @@ class FeaturesData:
         self.descriptors = descriptors
         self.colors = colors
         self.semantic = semantic
+        self._flann_index = None
+        self._flann_index_params = None
+
+    def flann_index(self, config: Dict[str, Any]) -> Any:
+        """FLANN index of the descriptors, rebuilt only if its parameters change."""
+        descriptors = self.descriptors
+        if descriptors is None:
+            raise RuntimeError("No descriptors found, cannot build FLANN index.")
+        params = flann_index_params(descriptors, config)
+        if self._flann_index is None or self._flann_index_params != params:
+            self._flann_index = context.flann_Index(descriptors, params)
+            self._flann_index_params = params
+        return self._flann_index
 
     def get_segmentation(self) -> Optional[np.ndarray]:
         semantic = self.semantic
@@ -110,24 +127,30 @@ class FeaturesData:
         descriptors = self.descriptors
         if descriptors is None:
             raise RuntimeError("No descriptors found, cannot save features data.")
+        if config["features_compression"]:
+            savez = np.savez_compressed
+        else:
+            savez = np.savez
         semantic = self.semantic
         if semantic:
             instances = semantic.instances
-            np.savez_compressed(
+            savez(
                 fileobject,
-                points=self.points.astype(np.float32),
-                descriptors=descriptors.astype(feature_data_type),
+                points=self.points.astype(np.float32, copy=False),
+                descriptors=descriptors.astype(feature_data_type, copy=False),
                 colors=self.colors,
-                segmentations=semantic.segmentation.astype(np.uint8),
-                instances=instances.astype(np.int16) if instances is not None else [],
+                segmentations=semantic.segmentation.astype(np.uint8, copy=False),
+                instances=instances.astype(np.int16, copy=False)
+                if instances is not None
+                else [],
                 segmentation_labels=np.array(semantic.labels).astype(str),
                 OPENSFM_FEATURES_VERSION=self.FEATURES_VERSION,
             )
         else:
-            np.savez_compressed(
+            savez(
                 fileobject,
-                points=self.points.astype(np.float32),
-                descriptors=descriptors.astype(feature_data_type),
+                points=self.points.astype(np.float32, copy=False),
+                descriptors=descriptors.astype(feature_data_type, copy=False),
                 colors=self.colors,
                 segmentations=[],
                 instances=[],
@@ -165,7 +188,7 @@ class FeaturesData:
             descriptors = data["descriptors"]
         points = data["points"]
         points[:, 2:3] = config["reprojection_error_sd"]
-        return FeaturesData(points, descriptors, data["colors"].astype(float), None)
+        return FeaturesData(points, descriptors, data["colors"], None)
 
     @classmethod
     def _from_file_v1(
@@ -180,9 +203,7 @@ class FeaturesData:
             descriptors = data["descriptors"].astype(np.float32)
         else:
             descriptors = data["descriptors"]
-        return FeaturesData(
-            data["points"], descriptors, data["colors"].astype(float), None
-        )
+        return FeaturesData(data["points"], descriptors, data["colors"], None)
 
     @classmethod
     def _from_file_v2(
@@ -232,9 +253,7 @@ class FeaturesData:
             )
         else:
             semantic_data = None
-        return FeaturesData(
-            data["points"], descriptors, data["colors"].astype(float), semantic_data
-        )
+        return FeaturesData(data["points"], descriptors, data["colors"], semantic_data)
 
     @classmethod
     def _from_file_v3(
@@ -253,20 +272,21 @@ class FeaturesData:
         else:
             descriptors = data["descriptors"]
 
-        has_segmentation = len(data["segmentations"]) > 0
-        has_instances = len(data["instances"]) > 0
+        # Each NpzFile lookup reads (and decompresses) the array again
+        segmentations = data["segmentations"]
+        instances = data["instances"]
+        has_segmentation = len(segmentations) > 0
+        has_instances = len(instances) > 0
 
         if has_segmentation or has_instances:
             semantic_data = SemanticData(
-                data["segmentations"] if has_segmentation else None,
-                data["instances"] if has_instances else None,
+                segmentations if has_segmentation else None,
+                instances if has_instances else None,
                 data["segmentation_labels"],
             )
         else:
             semantic_data = None
-        return FeaturesData(
-            data["points"], descriptors, data["colors"].astype(float), semantic_data
-        )
+        return FeaturesData(data["points"], descriptors, data["colors"], semantic_data)
 
 
 def resized_image(image: np.ndarray, max_size: int) -> np.ndarray:
@@ -281,11 +301,16 @@ def resized_image(image: np.ndarray, max_size: int) -> np.ndarray:
 
 
 def root_feature(desc: np.ndarray, l2_normalization: bool = False) -> np.ndarray:
+    """Square root mapping of a (N, D) descriptor array (RootSIFT).
+
+    Floating point descriptors are normalized in place, row by row.
+    """
+    if not np.issubdtype(desc.dtype, np.floating):
+        desc = desc.astype(np.float32)
     if l2_normalization:
-        s2 = np.linalg.norm(desc, axis=1)
-        desc = (desc.T / s2).T
-    s = np.sum(desc, 1)
-    desc = np.sqrt(desc.T / s).T
+        desc /= np.linalg.norm(desc, axis=1, keepdims=True)
+    desc /= np.sum(desc, axis=1, keepdims=True)
+    np.sqrt(desc, out=desc)
     return desc
 
 
@@ -296,48 +321,65 @@ def root_feature_surf(
     Experimental square root mapping of surf-like feature, only work for 64-dim surf now
     """
     if desc.shape[1] == 64:
+        desc = np.ascontiguousarray(desc)
         if l2_normalization:
-            s2 = np.linalg.norm(desc, axis=1)
-            desc = (desc.T / s2).T
+            desc /= np.linalg.norm(desc, axis=1, keepdims=True)
+        # s_sub = np.sum(desc_sub, 1)  # This partial normalization gives slightly better results for AKAZE surf
+        s_sub = np.sum(np.abs(desc), axis=1, keepdims=True)
         if partial:
-            ii = np.array([i for i in range(64) if (i % 4 == 2 or i % 4 == 3)])
+            # components i % 4 in (2, 3), as a view so that it's updated in place
+            desc_sub = desc.reshape(len(desc), 16, 4)[:, :, 2:]
+            s_sub = s_sub[:, :, np.newaxis]
         else:
-            ii = np.arange(64)
-        desc_sub = np.abs(desc[:, ii])
-        desc_sub_sign = np.sign(desc[:, ii])
-        # s_sub = np.sum(desc_sub, 1)  # This partial normalization gives slightly better results for AKAZE surf
-        s_sub = np.sum(np.abs(desc), 1)
-        desc_sub = np.sqrt(desc_sub.T / s_sub).T
-        desc[:, ii] = desc_sub * desc_sub_sign
+            desc_sub = desc
+        root = np.abs(desc_sub)
+        root /= s_sub
+        np.sqrt(root, out=root)
+        np.copysign(root, desc_sub, out=desc_sub)
     return desc
 
 
+def _image_coordinates_offset(
+    coords: np.ndarray, width: int, height: int
+) -> Tuple[float, np.ndarray]:
+    """Scale and (x, y) offset between pixel and normalized image coordinates.
+
+    The offset dtype follows the input when it is floating point so that the
+    fused expressions below don't upcast (and copy) float32 coordinates.
+    """
+    size = max(width, height)
+    dtype = np.result_type(coords.dtype, np.float32)
+    offset = np.array([width * 0.5 - 0.5, height * 0.5 - 0.5], dtype=dtype)
+    return size, offset
+
+
 def normalized_image_coordinates(
     pixel_coords: np.ndarray, width: int, height: int
 ) -> np.ndarray:
-    size = max(width, height)
-    p = np.empty((len(pixel_coords), 2))
-    p[:, 0] = (pixel_coords[:, 0] + 0.5 - width / 2.0) / size
-    p[:, 1] = (pixel_coords[:, 1] + 0.5 - height / 2.0) / size
-    return p
+    pixel_coords = np.asarray(pixel_coords)
+    size, offset = _image_coordinates_offset(pixel_coords, width, height)
+    return (pixel_coords[:, :2] - offset) / offset.dtype.type(size)
 
 
 def denormalized_image_coordinates(
     norm_coords: np.ndarray, width: int, height: int
 ) -> np.ndarray:
-    size = max(width, height)
-    p = np.empty((len(norm_coords), 2))
-    p[:, 0] = norm_coords[:, 0] * size - 0.5 + width / 2.0
-    p[:, 1] = norm_coords[:, 1] * size - 0.5 + height / 2.0
-    return p
+    norm_coords = np.asarray(norm_coords)
+    size, offset = _image_coordinates_offset(norm_coords, width, height)
+    return norm_coords[:, :2] * offset.dtype.type(size) + offset
 
 
 def normalize_features(
     points: np.ndarray, desc: np.ndarray, colors: np.ndarray, width: int, height: int
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray,]:
     """Normalize feature coordinates and size."""
-    points[:, :2] = normalized_image_coordinates(points[:, :2], width, height)
-    points[:, 2:3] /= max(width, height)
+    size = max(width, height)
+    # x, y and size are scaled by 1 / size, x and y are also centered
+    scale = np.ones(points.shape[1], dtype=np.float32)
+    scale[:3] = 1.0 / size
+    offset = np.zeros(points.shape[1], dtype=np.float32)
+    offset[:2] = (0.5 - width * 0.5) / size, (0.5 - height * 0.5) / size
+    points = points.astype(np.float32, copy=False) * scale + offset
     return points, desc, colors
 
 
@@ -348,6 +390,17 @@ def _in_mask(point: np.ndarray, width: int, height: int, mask: np.ndarray) -> bo
     return mask[int(v), int(u)] != 0
 
 
+def keypoints_to_array(keypoints: Any) -> np.ndarray:
+    """Convert OpenCV keypoints to a (N, 4) array of x, y, size and angle."""
+    count = len(keypoints)
+    points = np.empty((count, 4))
+    if count:
+        points[:, :2] = cv2.KeyPoint_convert(keypoints)
+        points[:, 2] = np.fromiter((k.size for k in keypoints), float, count)
+        points[:, 3] = np.fromiter((k.angle for k in keypoints), float, count)
+    return points
+
+
 def extract_features_sift(
     image: np.ndarray, config: Dict[str, Any], features_count: int
 ) -> Tuple[np.ndarray, np.ndarray]:
@@ -397,7 +450,7 @@ def extract_features_sift(
     if desc is not None:
         if config["feature_root"]:
             desc = root_feature(desc)
-        points = np.array([(i.pt[0], i.pt[1], i.size, i.angle) for i in points])
+        points = keypoints_to_array(points)
     else:
         points = np.array(np.zeros((0, 3)))
         desc = np.array(np.zeros((0, 3)))
@@ -453,7 +506,7 @@ def extract_features_surf(
     if desc is not None:
         if config["feature_root"]:
             desc = root_feature(desc)
-        points = np.array([(i.pt[0], i.pt[1], i.size, i.angle) for i in points])
+        points = keypoints_to_array(points)
     else:
         points = np.array(np.zeros((0, 3)))
         desc = np.array(np.zeros((0, 3)))
@@ -509,14 +562,17 @@ def extract_features_hahog(
         target_num_features=features_count,
     )
 
+    # Post-processing is done in place on the descriptor buffer
     if config["feature_root"]:
-        desc = np.sqrt(desc)
+        np.sqrt(desc, out=desc)
         uchar_scaling = 362  # x * 512 < 256  =>  sqrt(x) * 362 < 256
     else:
         uchar_scaling = 512
 
     if config["hahog_normalize_to_uchar"]:
-        desc = (uchar_scaling * desc).clip(0, 255).round()
+        desc *= uchar_scaling
+        np.clip(desc, 0, 255, out=desc)
+        np.round(desc, out=desc)
 
     logger.debug("Found {0} points in {1}s".format(len(points), time.time() - t))
     return points, desc
@@ -539,7 +595,7 @@ def extract_features_orb(
 
     points, desc = descriptor.compute(image, points)
     if desc is not None:
-        points = np.array([(i.pt[0], i.pt[1], i.size, i.angle) for i in points])
+        points = keypoints_to_array(points)
     else:
         points = np.array(np.zeros((0, 3)))
         desc = np.array(np.zeros((0, 3)))
@@ -548,6 +604,46 @@ def extract_features_orb(
     return points, desc
 
 
+EXTRACTORS: Dict[
+    str, Callable[[np.ndarray, Dict[str, Any], int], Tuple[np.ndarray, np.ndarray]]
+] = {
+    "SIFT": extract_features_sift,
+    "SURF": extract_features_surf,
+    "AKAZE": extract_features_akaze,
+    "HAHOG": extract_features_hahog,
+    "ORB": extract_features_orb,
+}
+
+
+def sample_colors(image: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Get the (N, 3) colors of an (h, w, 1|3) image at integer pixel positions.
+
+    Uses cv2.remap nearest-neighbour lookup. Its maps are laid out as
+    (rows, _REMAP_BLOCK) images as OpenCV limits remap sizes to SHRT_MAX.
+    """
+    count = len(xs)
+    if count == 0 or max(image.shape[:2]) >= _REMAP_MAX_SIZE:
+        colors = image[ys, xs]
+        if image.shape[2] == 1:
+            colors = np.repeat(colors, 3).reshape((-1, 3))
+        return colors
+
+    rows = -(-count // _REMAP_BLOCK)
+    map_x = np.zeros(rows * _REMAP_BLOCK, dtype=np.float32)
+    map_y = np.zeros(rows * _REMAP_BLOCK, dtype=np.float32)
+    map_x[:count] = xs
+    map_y[:count] = ys
+    colors = cv2.remap(
+        image,
+        map_x.reshape(rows, _REMAP_BLOCK),
+        map_y.reshape(rows, _REMAP_BLOCK),
+        cv2.INTER_NEAREST,
+    )
+    if image.shape[2] == 1:
+        colors = cv2.cvtColor(colors, cv2.COLOR_GRAY2RGB)
+    return colors.reshape((-1, 3))[:count]
+
+
 def extract_features(
     image: np.ndarray, config: Dict[str, Any], is_panorama: bool
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
@@ -586,40 +682,40 @@ def extract_features(
     assert image.shape[0] > 2 and image.shape[1] > 2
     assert np.issubdtype(image.dtype, np.uint8)
 
-    image = resized_image(image, extraction_size)
     if image.ndim == 2:  # convert (h, w) to (h, w, 1)
         image = np.expand_dims(image, axis=2)
 
-    # convert color to gray-scale if necessary
+    # convert color to gray-scale if necessary, before resizing so that
+    # only one channel goes through the resize filter
     if image.shape[2] == 3:
         image_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
     else:
-        image_gray = image
-    feature_type = config["feature_type"].upper()
-    if feature_type == "SIFT":
-        points, desc = extract_features_sift(image_gray, config, features_count)
-    elif feature_type == "SURF":
-        points, desc = extract_features_surf(image_gray, config, features_count)
-    elif feature_type == "AKAZE":
-        points, desc = extract_features_akaze(image_gray, config, features_count)
-    elif feature_type == "HAHOG":
-        points, desc = extract_features_hahog(image_gray, config, features_count)
-    elif feature_type == "ORB":
-        points, desc = extract_features_orb(image_gray, config, features_count)
-    else:
+        image_gray = image[:, :, 0]
+    image_gray = resized_image(image_gray, extraction_size)
+    height, width = image_gray.shape[:2]
+    try:
+        extractor = EXTRACTORS[config["feature_type"].upper()]
+    except KeyError:
         raise ValueError("Unknown feature type "
-                         + "(must be SURF, SIFT, AKAZE, HAHOG or ORB)")
+                         + "(must be SURF, SIFT, AKAZE, HAHOG or ORB)") from None
+    points, desc = extractor(image_gray, config, features_count)
 
-    xs = points[:, 0].round().astype(int)
-    ys = points[:, 1].round().astype(int)
-    colors = image[ys, xs]
-    if image.shape[2] == 1:
-        colors = np.repeat(colors, 3).reshape((-1, 3))
+    # sample colors in the full resolution image
+    scale_x = image.shape[1] / width
+    scale_y = image.shape[0] / height
+    xs = ((points[:, 0] + 0.5) * scale_x - 0.5).round().astype(int)
+    ys = ((points[:, 1] + 0.5) * scale_y - 0.5).round().astype(int)
+    xs = np.clip(xs, 0, image.shape[1] - 1)
+    ys = np.clip(ys, 0, image.shape[0] - 1)
+    colors = sample_colors(image, xs, ys)
 
-    return normalize_features(points, desc, colors, image.shape[1], image.shape[0])
+    return normalize_features(points, desc, colors, width, height)
 
 
-def build_flann_index(descriptors: np.ndarray, config: Dict[str, Any]) -> Any:
+def flann_index_params(
+    descriptors: np.ndarray, config: Dict[str, Any]
+) -> Dict[str, Any]:
+    """FLANN parameters used by build_flann_index for the descriptors."""
     # FLANN_INDEX_LINEAR = 0
     FLANN_INDEX_KDTREE = 1
     FLANN_INDEX_KMEANS = 2
@@ -653,5 +749,8 @@ def build_flann_index(descriptors: np.ndarray, config: Dict[str, Any]) -> Any:
         raise ValueError(
             f"FLANN isn't supported for feature type {descriptors.dtype.type}."
         )
+    return flann_params
 
-    return context.flann_Index(descriptors, flann_params)
+
+def build_flann_index(descriptors: np.ndarray, config: Dict[str, Any]) -> Any:
+    return context.flann_Index(descriptors, flann_index_params(descriptors, config))
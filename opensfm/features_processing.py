@@ -77,6 +77,10 @@ def run_features_processing(data: DataSetBase, images: List[str], force: bool) -
             )
         for _ in range(processes):
             arguments.append(("consumer", (process_queue)))
+        # Consumers are threads sharing the in-memory queue. parallel_map turns
+        # off OpenCV's own threading meanwhile to avoid nested parallelism, and
+        # the heavy parts of extraction (detectors, NumPy post-processing)
+        # release the GIL, so images are processed concurrently.
         parallel_map(process, arguments, processes, 1)
 
 
@@ -45,7 +45,9 @@ std::unique_ptr<Map> Map::DeepCopy(const Map& map, bool copy_observations) {
   }
 
   for (const auto& landmark : map.GetLandmarks()) {
-    map_copy->CreateLandmark(landmark.first, landmark.second.GetGlobalPos());
+    auto& landmark_copy =
+        map_copy->CreateLandmark(landmark.first, landmark.second.GetGlobalPos());
+    landmark_copy.SetColor(landmark.second.GetColor());
   }
 
   if (copy_observations) {
@@ -1,6 +1,7 @@
 # pyre-unsafe
 from typing import Optional
 
+import numpy as np
 import opensfm.synthetic_data.synthetic_scene as ss
 from opensfm import geo
 
@@ -20,8 +21,10 @@ def synthetic_circle_scene(
     return scene
 
 
-def synthetic_cube_scene() -> ss.SyntheticCubeScene:
-    return ss.SyntheticCubeScene(10, 1000, 0.001)
+def synthetic_cube_scene(
+    rng: Optional[np.random.Generator] = None,
+) -> ss.SyntheticCubeScene:
+    return ss.SyntheticCubeScene(10, 1000, 0.001, rng)
 
 
 def synthetic_rig_scene(
@@ -212,11 +212,14 @@ def generate_exifs(
             perturbations_2d = generate_causal_noise(
                 2, sequence_gps_dop, len(sequence_images), 2.0
             )
+        # Perturbed origins are converted to LLA in one go after the loop
+        origins = np.zeros((len(sequence_images), 3))
+        dops = []
         for i, shot_name in enumerate(sequence_images):
             shot = reconstruction.shots[shot_name]
             exif = exifs[shot_name]
 
-            origin = shot.pose.get_origin()
+            origins[i] = shot.pose.get_origin()
 
             if causal_gps_noise:
                 gps_perturbation = [perturbations_2d[j][i] for j in range(2)] + [0]
@@ -224,17 +227,11 @@ def generate_exifs(
                 gps_noise = _gps_dop(shot)
                 gps_perturbation = [gps_noise, gps_noise, 0]
 
-            origin = np.array([origin])
-            perturb_points(origin, gps_perturbation)
-            origin = origin[0]
+            perturb_points(origins[i : i + 1], gps_perturbation)
             _, _, _, comp = rc.shot_lla_and_compass(shot, reference)
-            lat, lon, alt = reference.to_lla(*origin)
 
             exif["gps"] = {}
-            exif["gps"]["latitude"] = lat
-            exif["gps"]["longitude"] = lon
-            exif["gps"]["altitude"] = alt
-            exif["gps"]["dop"] = _gps_dop(shot)
+            dops.append(_gps_dop(shot))
 
             omega, phi, kappa = geometry.opk_from_rotation(
                 shot.pose.get_rotation_matrix()
@@ -247,6 +244,16 @@ def generate_exifs(
 
             exif["compass"] = {"angle": comp}
 
+        lats, lons, alts = reference.to_lla(*origins.T)
+        for shot_name, lat, lon, alt, dop in zip(
+            sequence_images, lats, lons, alts, dops
+        ):
+            gps = exifs[shot_name]["gps"]
+            gps["latitude"] = lat
+            gps["longitude"] = lon
+            gps["altitude"] = alt
+            gps["dop"] = dop
+
     return exifs
 
 
@@ -146,4 +146,6 @@ def rmse(errors: np.ndarray) -> float:
 
 
 def mad(errors: np.ndarray) -> float:
-    return np.median(np.absolute(errors - np.median(errors)))
+    deviations = np.absolute(errors - np.median(errors))
+    # deviations is a temporary, so let median partition it in place
+    return np.median(deviations, overwrite_input=True)
@@ -1,6 +1,7 @@
 # pyre-unsafe
 import functools
 import math
+from copy import deepcopy
 from typing import Dict, Optional, List, Any, Union, Tuple, Callable
 
 import numpy as np
@@ -9,6 +10,11 @@ import opensfm.synthetic_data.synthetic_generator as sg
 import opensfm.synthetic_data.synthetic_metrics as sm
 from opensfm import pygeometry, types, pymap, geo
 
+# Points colors, shared by all points as Landmark.color copies them
+CUBE_POINT_COLOR = np.array([100, 100, 20], dtype=np.uint8)
+STREET_FLOOR_COLOR = np.array([120, 90, 10], dtype=np.uint8)
+STREET_WALL_COLOR = np.array([10, 90, 130], dtype=np.uint8)
+
 
 def get_camera(
     type: str, id: str, focal: float, k1: float, k2: float
@@ -64,18 +70,46 @@ def camera_pose(
     True
     """
 
-    def normalized(x: np.ndarray) -> np.ndarray:
-        return x / np.linalg.norm(x)
-
-    ez = normalized(np.array(lookat) - np.array(position))
-    ex = normalized(np.cross(ez, up))
-    ey = normalized(np.cross(ez, ex))
+    position = np.asarray(position, dtype=float)
+    rotation = camera_rotations(
+        position[np.newaxis], np.asarray([lookat], dtype=float), np.asarray([up])
+    )[0]
     pose = pygeometry.Pose()
-    pose.set_rotation_matrix(np.array([ex, ey, ez]))
+    pose.set_rotation_matrix(rotation)
     pose.set_origin(position)
     return pose
 
 
+def camera_rotations(
+    positions: np.ndarray, lookats: np.ndarray, ups: np.ndarray
+) -> np.ndarray:
+    """
+    Rotations of camera_pose, batched : (N, 3, 3) rotation matrices of
+    cameras at (N, 3) positions, looking at (N, 3) lookats with (N, 3) ups.
+
+    >>> position = [1.0, 2.0, 3.0]
+    >>> lookat = [0., 10.0, 2.0]
+    >>> up = [0.0, 0.0, 1.0]
+    >>> rotations = camera_rotations(
+    ...     np.array([position]), np.array([lookat]), np.array([up])
+    ... )
+    >>> np.allclose(rotations[0] @ rotations[0].T, np.eye(3))
+    True
+    >>> direction = np.subtract(lookat, position)
+    >>> np.allclose(rotations[0][2], direction / np.linalg.norm(direction))
+    True
+    """
+
+    def normalized(x: np.ndarray) -> np.ndarray:
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+    ez = normalized(lookats - positions)
+    ex = normalized(np.cross(ez, ups))
+    # ez and ex are orthonormal, so their cross product is already unit
+    ey = np.cross(ez, ex)
+    return np.stack([ex, ey, ez], axis=1)
+
+
 class SyntheticScene:
     def get_reconstruction(self) -> types.Reconstruction:
         raise NotImplementedError()
@@ -84,7 +118,15 @@ class SyntheticScene:
 class SyntheticCubeScene(SyntheticScene):
     """Scene consisting of cameras looking at point in a cube."""
 
-    def __init__(self, num_cameras: int, num_points: int, noise: float) -> None:
+    def __init__(
+        self,
+        num_cameras: int,
+        num_points: int,
+        noise: float,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        if rng is None:
+            rng = np.random.default_rng()
         self.reconstruction = types.Reconstruction()
         self.cameras = {}
         for i in range(num_cameras):
@@ -97,47 +139,38 @@ class SyntheticCubeScene(SyntheticScene):
         self.reconstruction.cameras = self.cameras
 
         r = 2.0
+        phi, theta, alpha = (
+            rng.random((num_cameras, 3)) * [math.pi, 2.0 * math.pi, 1.0]
+        ).T
+        sin_theta = np.sin(theta)
+        positions = r * np.column_stack(
+            [sin_theta * np.cos(phi), sin_theta * np.sin(phi), np.cos(theta)]
+        )
+        lookats = np.zeros((num_cameras, 3))
+        ups = np.column_stack([alpha * 0.2, alpha * 0.2, np.ones(num_cameras)])
+        rotations = camera_rotations(positions, lookats, ups)
+
         for i in range(num_cameras):
-            phi = np.random.rand() * math.pi
-            theta = np.random.rand() * 2.0 * math.pi
-            x = r * np.sin(theta) * np.cos(phi)
-            y = r * np.sin(theta) * np.sin(phi)
-            z = r * np.cos(theta)
-            position = np.array([x, y, z])
-
-            alpha = np.random.rand()
-            lookat = np.array([0.0, 0, 0])
-            up = np.array([alpha * 0.2, alpha * 0.2, 1.0])
             shot_id = "shot%04d" % i
             camera_id = "camera%04d" % i
-            pose = camera_pose(position, lookat, up)
+            pose = pygeometry.Pose()
+            pose.set_rotation_matrix(rotations[i])
+            pose.set_origin(positions[i])
             self.reconstruction.create_shot(
                 shot_id, camera_id, pose, rig_camera_id=None, rig_instance_id=None
             )
 
-        points = np.random.rand(num_points, 3) - [0.5, 0.5, 0.5]
-        for i, p in enumerate(points):
-            point_id = "point" + str(i)
-            pt = self.reconstruction.create_point(point_id, p)
-            pt.color = np.array([100, 100, 20])
+        points = rng.random((num_points, 3)) - [0.5, 0.5, 0.5]
+        point_ids = [f"point{i}" for i in range(num_points)]
+        for point_id, p in zip(point_ids, points):
+            self.reconstruction.create_point(point_id, p).color = CUBE_POINT_COLOR
 
-    def get_reconstruction(self) -> types.Reconstruction:
-        reconstruction = types.Reconstruction()
-        # Copy our original reconstruction
-        # since we do not want to modify the reference
-        reconstruction.cameras = self.cameras
-        for shot in self.reconstruction.shots.values():
-            reconstruction.create_shot(
-                shot.id,
-                shot.camera.id,
-                shot.pose,
-                rig_camera_id=None,
-                rig_instance_id=None,
-            )
-        for point in self.reconstruction.points.values():
-            pt = reconstruction.create_point(point.id, point.coordinates)
-            pt.color = point.color
-        return reconstruction
+    def get_reconstruction(self, copy: bool = True) -> types.Reconstruction:
+        # Copy our original reconstruction since we do not want callers to
+        # modify the reference, unless they explicitly ask for it (read-only)
+        if not copy:
+            return self.reconstruction
+        return deepcopy(self.reconstruction)
 
 
 class SyntheticStreetScene(SyntheticScene):
@@ -193,10 +226,11 @@ class SyntheticStreetScene(SyntheticScene):
         combined_scene.rig_cameras = self.rig_cameras + other_scene.rig_cameras
         combined_scene.shot_ids = self.shot_ids + other_scene.shot_ids
 
+        total = sum(len(subshots) for subshots in combined_scene.shot_ids)
+        all_ids = [f"Shot {i:04d}" for i in range(total)]
         shift = 0
         for subshots in combined_scene.shot_ids:
-            for i in range(len(subshots)):
-                subshots[i] = f"Shot {i+shift:04d}"
+            subshots[:] = all_ids[shift : shift + len(subshots)]
             shift += len(subshots)
         return combined_scene
 
@@ -238,37 +272,24 @@ class SyntheticStreetScene(SyntheticScene):
     def _set_terrain_hill_single(self, height: float, radius: float) -> None:
         wall_points, floor_points = self.wall_points, self.floor_points
         assert wall_points is not None and floor_points is not None
-        wall_points[:, 2] += height * np.exp(
-            -0.5 * np.linalg.norm(wall_points[:, :2], axis=1) ** 2 / radius ** 2
-        )
-        floor_points[:, 2] += height * np.exp(
-            -0.5 * np.linalg.norm(floor_points[:, :2], axis=1) ** 2 / radius ** 2
-        )
+        exp_factor = -0.5 / (radius * radius)
+        for points in (wall_points, floor_points):
+            # squared XY norm, without the sqrt of np.linalg.norm
+            xy = points[:, :2]
+            squared_norms = np.einsum("ij,ij->i", xy, xy)
+            points[:, 2] += height * np.exp(exp_factor * squared_norms)
 
         for positions in self.instances_positions:
-            for position in positions:
-                position[2] += height * np.exp(
-                    -0.5
-                    * np.linalg.norm(
-                        (position[0] ** 2 + position[1] ** 2) / radius ** 2
-                    )
-                )
+            squared_norms = positions[:, 0] ** 2 + positions[:, 1] ** 2
+            positions[:, 2] += height * np.exp(exp_factor * squared_norms)
 
     def _set_terrain_hill_repeated(self, height: float, radius: float) -> None:
         wall_points, floor_points = self.wall_points, self.floor_points
         assert wall_points is not None and floor_points is not None
-        wall_points[:, 2] += height * np.sin(
-            np.linalg.norm(wall_points[:, :2], axis=1) / radius
-        )
-        floor_points[:, 2] += height * np.sin(
-            np.linalg.norm(floor_points[:, :2], axis=1) / radius
-        )
-
-        for positions in self.instances_positions:
-            for position in positions:
-                position[2] += height * np.sin(
-                    math.sqrt(position[0] ** 2 + position[1] ** 2) / radius
-                )
+        inv_radius = 1.0 / radius
+        for points in (wall_points, floor_points, *self.instances_positions):
+            distances = np.hypot(points[:, 0], points[:, 1])
+            points[:, 2] += height * np.sin(distances * inv_radius)
 
     def add_camera_sequence(
         self,
@@ -305,10 +326,8 @@ class SyntheticStreetScene(SyntheticScene):
         rig_camera = pymap.RigCamera(pygeometry.Pose(), camera.id)
         self.rig_cameras.append([rig_camera])
 
-        rig_instances = []
-        for shot_id in new_shot_ids:
-            rig_instances.append([(shot_id, camera.id)])
-        self.rig_instances.append(rig_instances)
+        camera_id = camera.id
+        self.rig_instances.append([[(shot_id, camera_id)] for shot_id in new_shot_ids])
         self.instances_positions.append(positions)
         self.instances_rotations.append(rotations)
 
@@ -340,30 +359,17 @@ class SyntheticStreetScene(SyntheticScene):
         sg.perturb_points(instances_positions, position_noise)
         sg.perturb_rotations(instances_rotations, rotation_noise)
 
+        # Shot poses are composed from the rig instance and RigCamera
+        # in sg.create_reconstruction
         shift = sum(len(s) for s in self.shot_ids)
-        shots_ids_per_camera = []
-        for j, (rig_camera_p, rig_camera_r) in enumerate(
-            zip(relative_positions, relative_rotations)
-        ):
-            # pyre-fixme[6]: For 1st argument expected `ndarray` but got `List[float]`.
-            pose_rig_camera = pygeometry.Pose(rig_camera_r)
-            # pyre-fixme[6]: For 1st argument expected `ndarray` but got `List[float]`.
-            pose_rig_camera.set_origin(rig_camera_p)
-
-            rotations = []
-            positions = []
-            for instance_p, instance_r in zip(instances_positions, instances_rotations):
-                pose_instance = pygeometry.Pose(instance_r)
-                pose_instance.set_origin(instance_p)
-                composed = pose_rig_camera.compose(pose_instance)
-                rotations.append(composed.rotation)
-                positions.append(composed.get_origin())
-
-            camera_shot_ids = []
-            for i in range(len(positions)):
-                shot_index = i * len(relative_positions) + j
-                camera_shot_ids.append(f"Shot {shift+shot_index:04d}")
-            shots_ids_per_camera.append(camera_shot_ids)
+        num_rig_cameras = len(relative_positions)
+        shots_ids_per_camera = [
+            [
+                f"Shot {shift + i * num_rig_cameras + j:04d}"
+                for i in range(len(instances_positions))
+            ]
+            for j in range(num_rig_cameras)
+        ]
         self.cameras.append(cameras)
         self.shot_ids += shots_ids_per_camera
 
@@ -383,12 +389,10 @@ class SyntheticStreetScene(SyntheticScene):
             rig_cameras.append(rig_camera)
         self.rig_cameras.append(rig_cameras)
 
-        rig_instances: List[List[Tuple[str, str]]] = []
-        for i in range(len(instances_positions)):
-            instance = []
-            for j in range(len(shots_ids_per_camera)):
-                instance.append((shots_ids_per_camera[j][i], rig_camera_ids[j]))
-            rig_instances.append(instance)
+        rig_instances: List[List[Tuple[str, str]]] = [
+            list(zip(shots_ids, rig_camera_ids))
+            for shots_ids in zip(*shots_ids_per_camera)
+        ]
         self.rig_instances.append(rig_instances)
         self.instances_positions.append(instances_positions)
         self.instances_rotations.append(instances_rotations)
@@ -396,12 +400,9 @@ class SyntheticStreetScene(SyntheticScene):
         return self
 
     def get_reconstruction(self) -> types.Reconstruction:
-        floor_color = [120, 90, 10]
-        wall_color = [10, 90, 130]
-
         return sg.create_reconstruction(
-            points=np.asarray([self.floor_points, self.wall_points], dtype=object),
-            colors=np.asarray([floor_color, wall_color]),
+            points=[self.floor_points, self.wall_points],
+            colors=[STREET_FLOOR_COLOR, STREET_WALL_COLOR],
             cameras=self.cameras,
             shot_ids=self.shot_ids,
             rig_shots=self.rig_instances,
@@ -483,6 +484,14 @@ def compare(
     aligned_points = sm.points_errors(reference, aligned)
     aligned_gps = sm.gps_errors(aligned)
 
+    # Square the GCP errors once for both the horizontal and vertical RMSE
+    if len(absolute_gcp.shape) > 1:
+        gcp_squared = absolute_gcp**2
+        gcp_rmse_horizontal = np.sqrt(np.mean(gcp_squared[:, :2]))
+        gcp_rmse_vertical = np.sqrt(np.mean(gcp_squared[:, 2]))
+    else:
+        gcp_rmse_horizontal, gcp_rmse_vertical = 0.0, 0.0
+
     return {
         "ratio_cameras": completeness[0],
         "ratio_points": completeness[1],
@@ -494,12 +503,8 @@ def compare(
         "absolute_points_mad": sm.mad(absolute_points),
         "absolute_gps_rmse": sm.rmse(absolute_gps),
         "absolute_gps_mad": sm.mad(absolute_gps),
-        "absolute_gcp_rmse_horizontal": sm.rmse(absolute_gcp[:, :2])
-        if len(absolute_gcp.shape) > 1
-        else 0.0,
-        "absolute_gcp_rmse_vertical": sm.rmse(absolute_gcp[:, 2])
-        if len(absolute_gcp.shape) > 1
-        else 0.0,
+        "absolute_gcp_rmse_horizontal": gcp_rmse_horizontal,
+        "absolute_gcp_rmse_vertical": gcp_rmse_vertical,
         "aligned_position_rmse": sm.rmse(aligned_position),
         "aligned_position_mad": sm.mad(aligned_position),
         "aligned_rotation_rmse": sm.rmse(aligned_rotation),
@@ -61,7 +61,7 @@ def scene_synthetic() -> synthetic_scene.SyntheticInputData:
 @pytest.fixture(scope="session")
 def scene_synthetic_cube() -> Tuple[types.Reconstruction, pymap.TracksManager]:
     np.random.seed(42)
-    data = synthetic_examples.synthetic_cube_scene()
+    data = synthetic_examples.synthetic_cube_scene(np.random.default_rng(42))
 
     reference = geo.TopocentricConverter(47.0, 6.0, 0)
     reconstruction = data.get_reconstruction()
@@ -134,7 +134,7 @@ def pairs_and_poses() -> Tuple[
     types.Reconstruction,
 ]:
     np.random.seed(42)
-    data = synthetic_examples.synthetic_cube_scene()
+    data = synthetic_examples.synthetic_cube_scene(np.random.default_rng(42))
 
     reconstruction = data.get_reconstruction()
     reference = geo.TopocentricConverter(0, 0, 0)
@@ -14,11 +14,15 @@ except ImportError:
     DATA_PATH = os.path.abspath("data")
 
 
+# Only the read-only inputs are linked: tests write their outputs (features,
+# matches, reconstructions) into the dataset folder, so it can't be shared.
+BERLIN_INPUTS = ("images", "masks", "config.yaml", "ground_control_points.json")
+
+
 def create_berlin_test_folder(tmpdir) -> opensfm.dataset.DataSet:
     src = os.path.join(DATA_PATH, "berlin")
     dst = str(tmpdir.mkdir("berlin"))
-    files = ["images", "masks", "config.yaml", "ground_control_points.json"]
-    for filename in files:
+    for filename in BERLIN_INPUTS:
         os.symlink(os.path.join(src, filename), os.path.join(dst, filename))
     return opensfm.dataset.DataSet(dst)
 
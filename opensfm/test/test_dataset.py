@@ -1,4 +1,6 @@
 # pyre-unsafe
+import zipfile
+
 import numpy as np
 from opensfm import features
 from opensfm.test import data_generation
@@ -35,3 +37,35 @@ def test_dataset_load_features_sift(tmpdir) -> None:
         semantic.segmentation,
     )
     assert np.allclose(instances, semantic.instances)
+
+
+def test_dataset_load_features_uncompressed(tmpdir) -> None:
+    data = data_generation.create_berlin_test_folder(tmpdir)
+    data.config["feature_type"] = "SIFT"
+
+    image = data.images()[0]
+    points = np.random.random((3, 4))
+    descriptors = np.random.random((128, 4))
+    colors = np.random.randint(low=0, high=255, size=(3, 3), dtype=np.uint8)
+    before = features.FeaturesData(points, descriptors, colors, None)
+
+    # Features are compressed by default
+    data.save_features(image, before)
+    with zipfile.ZipFile(data._feature_file(image)) as archive:
+        assert all(
+            info.compress_type == zipfile.ZIP_DEFLATED for info in archive.infolist()
+        )
+
+    data.config["features_compression"] = False
+    data.save_features(image, before)
+    with zipfile.ZipFile(data._feature_file(image)) as archive:
+        assert all(
+            info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()
+        )
+
+    after = data.load_features(image)
+    assert after
+    assert np.allclose(points, after.points)
+    assert np.allclose(descriptors, after.descriptors)
+    assert np.array_equal(colors, after.colors)
+    assert after.semantic is None
@@ -1105,6 +1105,18 @@ def test_rec_deepcopy() -> None:
 
     assert_maps_equal(rec.map, rec2.map)
 
+
+def test_rec_deepcopy_keeps_point_colors() -> None:
+    rec = _create_reconstruction(n_points=10)
+    for i, point in enumerate(rec.points.values()):
+        point.color = [i, 100, 20]
+
+    rec2 = copy.deepcopy(rec)
+
+    for point_id, point in rec.points.items():
+        assert np.array_equal(rec2.points[point_id].color, point.color)
+
+
 def test_gcp() -> None:
     gcp = []
     for i in range(0, 10):
@@ -0,0 +1,64 @@
+# pyre-unsafe
+import numpy as np
+from opensfm import config, features
+
+
+def _random_features_data(n_features: int) -> features.FeaturesData:
+    points = np.random.rand(n_features, 4)
+    descriptors = np.random.rand(n_features, 128).astype(np.float32)
+    colors = np.random.randint(0, 255, (n_features, 3))
+    return features.FeaturesData(points, descriptors, colors, None)
+
+
+def test_flann_index_cached_per_config() -> None:
+    features_data = _random_features_data(100)
+    configuration = config.default_config()
+
+    index = features_data.flann_index(configuration)
+    assert features_data.flann_index(dict(configuration)) is index
+
+    configuration["flann_algorithm"] = "KDTREE"
+    kdtree_index = features_data.flann_index(configuration)
+    assert kdtree_index is not index
+
+    configuration["flann_branching"] += 1
+    assert features_data.flann_index(configuration) is not kdtree_index
+
+
+def test_flann_index_not_shared_with_masked_features() -> None:
+    features_data = _random_features_data(100)
+    configuration = config.default_config()
+
+    index = features_data.flann_index(configuration)
+    masked = features_data.mask(np.arange(100) % 2 == 0)
+    assert masked.flann_index(configuration) is not index
+
+
+def _expected_colors(image: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    colors = image[ys, xs]
+    if image.shape[2] == 1:
+        colors = np.repeat(colors, 3).reshape((-1, 3))
+    return colors
+
+
+def test_sample_colors() -> None:
+    height, width = 60, 80
+    for channels in (3, 1):
+        image = np.random.randint(0, 255, (height, width, channels), dtype=np.uint8)
+        for count in (0, 1, 1023, 1024, 1025, 3000):
+            xs = np.random.randint(0, width, count)
+            ys = np.random.randint(0, height, count)
+            colors = features.sample_colors(image, xs, ys)
+            assert colors.shape == (count, 3)
+            assert np.array_equal(colors, _expected_colors(image, xs, ys))
+
+
+def test_sample_colors_large_image() -> None:
+    # Too wide for cv2.remap, sampled with NumPy indexing instead
+    height, width = 2, 40000
+    for channels in (3, 1):
+        image = np.random.randint(0, 255, (height, width, channels), dtype=np.uint8)
+        xs = np.random.randint(0, width, 100)
+        ys = np.random.randint(0, height, 100)
+        colors = features.sample_colors(image, xs, ys)
+        assert np.array_equal(colors, _expected_colors(image, xs, ys))
@@ -63,6 +63,17 @@ def test_match_using_words() -> None:
         assert i == j
 
 
+def test_exact_words_match_bruteforce() -> None:
+    words, frequencies = bow.load_bow_words_and_frequencies(config.default_config())
+    bag_of_words = bow.BagOfWords(words, frequencies)
+
+    features = np.random.normal(size=(100, 128)).astype(np.float32)
+    exact = compute_words(features, bag_of_words, 5, "EXACT")
+    bruteforce = compute_words(features, bag_of_words, 5, "BruteForce")
+    assert exact.shape == (100, 5)
+    assert np.array_equal(exact[:, 0], bruteforce[:, 0])
+
+
 def test_unfilter_matches() -> None:
     matches = np.array([])
     m1 = np.array([], dtype=bool)